@@ -1,16 +1,20 @@
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+import io
+import os
 import time
+import inspect
+from functools import partial
+
+# Keep the kernels generated by torch.compile (Inductor) in a local directory so that reruns reuse them
+# instead of compiling again. These must be set before torch is imported.
+os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', './.inductor_cache')
+os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
 
 import torch, torch.nn as nn, torch.optim as optim
 import torch.nn.functional as AF
-from torchvision import datasets, transforms
-from torch.utils.data import DataLoader, TensorDataset
 
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import LabelEncoder 
+from preprocess_483 import load_tfidf_tensors
+
 from sklearn.metrics import accuracy_score, precision_score, confusion_matrix, classification_report, ConfusionMatrixDisplay
 
 ###################### Designing an ANN architectures #########################
@@ -20,28 +24,90 @@ class MLP(nn.Module): # All models should inherit from nn.Module
     # This part can be changed based on the design decision.
     def __init__(self, num_input, hidden1_size, num_classes): # Define our ANN structures here
         super(MLP, self).__init__()
-        # nn.Linear(in_features, out_features, bias): y = w^Tx + bias
-        self.hidden1 = nn.Linear(num_input, hidden1_size)    # connection between input and hidden layer1
-        self.output = nn.Linear(hidden1_size, num_classes)
-        
-        # The model structure can be also defined using "sequential" function
-        # self.seq_linear=nn.Sequential(nn.Linear(num_input, hidden1_size),nn.RELU(),nn.Linear(hidden1_size, num_classes))
+        # hidden1 (connection between input and hidden layer1): y = w^Tx + bias for a sparse TF-IDF row x is the sum of
+        # the rows of w for the nonzero token ids, weighted by their TF-IDF values, i.e. an EmbeddingBag with mode='sum'.
+        self.hidden1 = nn.EmbeddingBag(num_input, hidden1_size, mode='sum')
+        self.hidden1_bias = nn.Parameter(torch.zeros(hidden1_size))
+        # same initialization as nn.Linear(num_input, hidden1_size): U(-1/sqrt(num_input), 1/sqrt(num_input))
+        bound = 1 / np.sqrt(num_input)
+        nn.init.uniform_(self.hidden1.weight, -bound, bound)
+        nn.init.uniform_(self.hidden1_bias, -bound, bound)
+        # The rest of the model structure is defined using "sequential" function: ReLU -> output layer.
+        # In this implementation, the activation function is reLU, but you can try other functions.
+        # inplace=True lets ReLU overwrite the hidden1 output instead of allocating a new buffer.
+        self.net = nn.Sequential(
+            nn.ReLU(inplace=True),
+            nn.Linear(hidden1_size, num_classes),
+        )
 
     # Define "forward" function to perform the computation for input x and return output(s).
     # The function name "forward" is required by Pytorch.
-    def forward(self, x):
-        # In this implementation, the activation function is reLU, but you can try other functions
-        # torch.nn.functional modeule consists of all the activation functions and output functions
-        h1_out = AF.relu(self.hidden1(x))
-        output = self.output(h1_out)
+    # The input x is a batch of sparse TF-IDF rows given as (input_ids, offsets, tfidf_values), see csr_to_bags().
+    def forward(self, input_ids, offsets, tfidf_values):
+        h1_out = self.hidden1(input_ids, offsets, per_sample_weights=tfidf_values) + self.hidden1_bias
         # AF.softmax() is NOT needed when CrossEntropyLoss() is used as it already combines both LogSoftMax() and NLLLoss()
-        
-        # return self.seq_linear(x) # If the model structrue is define by sequential function.
-        return output
-
+        return self.net(h1_out)
+
+
+### Sparse TF-IDF dataset
+# TF-IDF rows are ~99% zeros, so the matrix is kept in CSR format instead of being densified.
+# The model takes a batch of rows as (input_ids, offsets, tfidf_values): the nonzero column ids of all rows
+# concatenated, the start of each row in input_ids, and the matching TF-IDF values.
+def csr_to_bags(X_csr):
+    return X_csr.col_indices(), X_csr.crow_indices()[:-1], X_csr.values()
+
+# Mini batches of a device-resident sparse TF-IDF matrix, replacing Dataset + DataLoader.
+# Shuffling and batching are done by indexing on the device: each epoch, torch.randperm reorders the rows of the
+# CSR matrix once, then every batch is a contiguous slice of the reordered rows given as ((input_ids, offsets, tfidf_values), labels).
+# pad_nnz=True pads input_ids/tfidf_values of every batch up to the next power of two of its nnz, by appending entries
+# with id 0 and weight 0 to the last bag. The results are unchanged, but batches only come in a handful of shapes
+# (with drop_last=True), so a compiled model records one CUDA graph per power of two instead of one per distinct nnz,
+# while a batch never carries more than its own nnz in padding.
+class SparseTfidfBatches:
+    def __init__(self, X_csr, labels, batch_size, shuffle=False, drop_last=False, pad_nnz=False):
+        self.crow = X_csr.crow_indices()
+        self.col = X_csr.col_indices()
+        self.values = X_csr.values()
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.pad_nnz = pad_nnz
+
+    def __len__(self):
+        num_rows = len(self.labels)
+        return num_rows // self.batch_size if self.drop_last else -(-num_rows // self.batch_size)
+
+    def __iter__(self):
+        num_rows = len(self.labels)
+        if self.shuffle:
+            perm = torch.randperm(num_rows, device=self.labels.device)
+            starts = self.crow[perm]
+            lengths = self.crow[perm+1] - starts
+            crow = torch.zeros_like(self.crow)
+            crow[1:] = torch.cumsum(lengths, dim=0)
+            # position in col/values of every nonzero entry of the reordered rows (nnz is unchanged, so no sync)
+            positions = torch.repeat_interleave(starts - crow[:-1], lengths, output_size=self.col.shape[0]) + torch.arange(self.col.shape[0], device=self.col.device)
+            col, values, labels = self.col[positions], self.values[positions], self.labels[perm]
+        else:
+            crow, col, values, labels = self.crow, self.col, self.values, self.labels
+        crow_host = crow.tolist()  # one copy per epoch, so batch boundaries are sliced without a sync per batch
+        for batch_cnt in range(len(self)):
+            first_row = batch_cnt * self.batch_size
+            last_row = min(first_row + self.batch_size, num_rows)
+            start, end = crow_host[first_row], crow_host[last_row]
+            offsets = crow[first_row:last_row] - start
+            input_ids, tfidf_values = col[start:end], values[start:end]
+            if self.pad_nnz:
+                batch_nnz = end - start
+                num_padding = (1 << max(batch_nnz - 1, 0).bit_length()) - batch_nnz
+                input_ids = torch.cat([input_ids, input_ids.new_zeros(num_padding)])
+                tfidf_values = torch.cat([tfidf_values, tfidf_values.new_zeros(num_padding)])
+            yield (input_ids, offsets, tfidf_values), labels[first_row:last_row]
 
 # To display some images
 def show_some_digit_images(images):
+    import matplotlib.pyplot as plt # imported here so training runs do not pay for loading matplotlib
     print("> Shapes of image:", images.shape)
     #print("Matrix for one image:")
     #print(images[1][0])
@@ -63,15 +129,40 @@ def print_confusion_matrix(cm):
     print(f"Actual 0     TN: {cm[0, 0]:<5} FP: {cm[0, 1]:<5}")
     print(f"       1     FN: {cm[1, 0]:<5} TP: {cm[1, 1]:<5}")
 
+# size of the model's parameters when saved to disk
+def model_size_in_bytes(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
 # Training function
 def train_ANN_model(num_epochs, training_data, device, CUDA_enabled, ANN_model, loss_func, optimizer):
-    train_losses = []
+    # Losses are collected in a pre-allocated buffer on the device; calling loss.item() every step
+    # would force the CPU to wait for the GPU (a sync point) on every iteration.
+    loss_buf = torch.empty(num_epochs * len(training_data), device=device)
+    global_step = 0
 
-    start = time.time()
     ANN_model.train() # to set the model in training mode. Only Dropout and BatchNorm care about this flag.
-    end = time.time()
-    training_time = end - start
 
+    # Automatic Mixed Precision (AMP): forward + loss run in FP16 on the GPU, GradScaler scales the loss
+    # so small FP16 gradients do not underflow. Only used on GPUs with tensor cores (Volta+, compute capability 7.0);
+    # older GPUs such as the GTX 1080 Ti (6.1) run FP16 arithmetic much slower than FP32. Both are no-ops otherwise.
+    use_amp = (device.type == 'cuda' and CUDA_enabled and torch.cuda.get_device_capability(device) >= (7, 0))
+    scaler = torch.amp.GradScaler('cuda', enabled=use_amp)
+
+    # Warm up: the first iterations of a compiled model trigger compilation and CUDA graph recording,
+    # so run a few forward/backward passes (without updating the weights) before starting the timer.
+    # An eager (not compiled) model has nothing to warm up.
+    if hasattr(ANN_model, '_orig_mod'):
+        warmup_features, warmup_labels = next(iter(training_data))
+        for _ in range(3):
+            with torch.autocast(device_type='cuda', dtype=torch.float16, enabled=use_amp):
+                warmup_loss = loss_func(ANN_model(*warmup_features), warmup_labels)
+            scaler.scale(warmup_loss).backward()
+        optimizer.zero_grad(set_to_none=True)
+        torch.cuda.synchronize(device) # the warm-up work is queued asynchronously; finish it before the timer starts
+
+    start = time.time()
     for epoch_cnt in range(num_epochs):
         for batch_cnt, (features, labels) in enumerate(training_data):
             # Each batch contain batch_size (100) images, each of which 1 channel 28x28
@@ -80,52 +171,51 @@ def train_ANN_model(num_epochs, training_data, device, CUDA_enabled, ANN_model,
             # -1 tells NumPy to flatten to 1D (784 pixels as input) for batch_size images
             # the size -1 is inferred from other dimensions
             # images = images.reshape(-1, 784) # or images.view(-1, 784) or torch.flatten(images, start_dim=1)
+            # No per-batch host-to-device copy: the datasets are already resident on the device.
 
-            if (device.type == 'cuda' and CUDA_enabled):
-                features = features.to(device) # moving tensors to device
-                labels = labels.to(device)
-
-            optimizer.zero_grad() # set the cumulated gradient to zero
-            output = ANN_model(features) # feedforward images as input to the network
-            loss = loss_func(output, labels) # computing loss
+            optimizer.zero_grad(set_to_none=True) # reset the cumulated gradient (set_to_none skips the zero-fill kernel)
+            with torch.autocast(device_type='cuda', dtype=torch.float16, enabled=use_amp):
+                output = ANN_model(*features) # feedforward the TF-IDF rows as input to the network
+                loss = loss_func(output, labels) # computing loss
             #print("Loss: ", loss)
             #print("Loss item: ", loss.item())
-            train_losses.append(loss.item())
+            loss_buf[global_step].copy_(loss.detach(), non_blocking=True)
+            global_step += 1
             # PyTorch's Autograd engine (automatic differential (chain rule) package) 
-            loss.backward() # calculating gradients backward using Autograd
-            optimizer.step() # updating all parameters after every iteration through backpropagation
+            scaler.scale(loss).backward() # calculating gradients backward using Autograd (on the scaled loss)
+            scaler.step(optimizer) # unscales the gradients, then updates all parameters through backpropagation
+            scaler.update() # adjusts the loss scale for the next iteration
 
-            # Display the training status
-            if (batch_cnt+1) % 10 == 0:
+            # Display the training status (rarely, since reading the loss back is a sync point)
+            if batch_cnt % 50 == 0:
                 # print(f"Epoch={epoch_cnt+1}/{num_epochs}, batch={batch_cnt+1}/{num_train_batches}, loss={loss.item()}")
-                print(f"Epoch={epoch_cnt+1}/{num_epochs}, batch={batch_cnt+1}, loss={loss.item()}")
+                print(f"Epoch={epoch_cnt+1}/{num_epochs}, batch={batch_cnt+1}, loss={loss_buf[global_step-1].item()}")
+    # GPU work is queued asynchronously (there is no per-step sync), so wait for it to finish before stopping the timer
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    end = time.time()
+    training_time = end - start
+    train_losses = loss_buf[:global_step].cpu().tolist()
     return train_losses, training_time
 
 # Testing function
-def test_ANN_model(device, CUDA_enabled, ANN_model, testing_data):
-    # torch.no_grad() is a decorator for the step method
-    # making "require_grad" false since no need to keeping track of gradients    
-    predicted_labels=[]
-    true_labels = []
-    # torch.no_grad() deactivates Autogra engine (for weight updates). This help run faster
-    with torch.no_grad():
+def test_ANN_model(device, ANN_model, test_features, test_labels):
+    # The whole test set fits in memory, so it is evaluated in a single forward pass instead of mini batches.
+    # torch.inference_mode() deactivates Autogra engine (for weight updates) like torch.no_grad(),
+    # and also skips the version-counter bookkeeping of tensors. This help run faster
+    with torch.inference_mode():
         ANN_model.eval() # # set the model in testing mode. Only Dropout and BatchNorm care about this flag.
-        for batch_cnt, (features, labels) in enumerate(testing_data):
-            # images = images.reshape(-1, 784) # or images.view(-1, 784) or torch.flatten(images, start_dim=1)
-
-            if (device.type == 'cuda' and CUDA_enabled):
-                features = features.to(device) # moving tensors to device
-                labels = labels.to(device)
-            
-            output = ANN_model(features)
-            _, predictions = torch.max(output,1) # returns the max value of all elements in the input tensor
-            predicted_labels.extend(predictions.cpu().numpy())
-            num_samples = labels.shape[0]
-            true_labels.extend(labels.cpu().numpy())
-            num_correct = (predictions == labels).sum().item()
-            accuracy = num_correct/num_samples
-            if (batch_cnt+1) % mini_batch_size == 0:
-                print(f"batch={batch_cnt+1}/{num_test_batches}")
+        features = [x.to(device) for x in test_features] # no-op when the test set is already resident on the device
+        labels = test_labels.to(device)
+        output = ANN_model(*features)
+        predictions = output.argmax(dim=1) # index of the max logit is the predicted class
+        # copy the results to the host once and count the correct predictions there,
+        # so there is no separate .item() sync for the accuracy
+        predicted_labels = predictions.cpu().numpy()
+        true_labels = labels.cpu().numpy()
+        num_samples = true_labels.shape[0]
+        num_correct = int((predicted_labels == true_labels).sum())
+        accuracy = num_correct/num_samples
         print("> Number of samples =", num_samples, "\nnumber of correct prediction =", num_correct, "\naccuracy =", accuracy)
     return predicted_labels, true_labels
 
@@ -140,6 +230,11 @@ def test_ANN_model(device, CUDA_enabled, ANN_model, testing_data):
 # Note: If Pytorch and CUDA versions are not compatible, Pytorch will not be able to recognize your GPU
 # (4) The following codes will verify if Pytorch is able to recognize the CUDA Toolkit:
 device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+# Allow TF32 tensor cores (Ampere and newer GPUs) for FP32 matmuls that run outside of autocast.
+# Has no effect on older GPUs or the CPU.
+torch.set_float32_matmul_precision('high')
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
 if (torch.cuda.is_available()):
     print("The CUDA version is", torch.version.cuda)
     # Device configuration: use GPU if available, or use CPU
@@ -149,16 +244,17 @@ if (torch.cuda.is_available()):
     print("GPU will be utilized for computation.")
 else:
     print("CUDA is supported in your machine. Only CPU will be used for computation.")
+
+# To turn on/off CUDA if I don't want to use it.
+CUDA_enabled = True
+if not (device.type == 'cuda' and CUDA_enabled):
+    device = torch.device('cpu')
+# torch.compile (Inductor) generates Triton kernels, which need compute capability 7.0+; older GPUs (e.g. GTX 1080 Ti) run eager.
+compile_model = (device.type == 'cuda' and torch.cuda.get_device_capability(device) >= (7, 0))
 #exit()
 
 ############################### ANN modeling #################################
-### Convert the image into numbers: transforms.ToTensor()
-# It separate the image into three color channels RGB and converts the pixels of each images to the brightness
-# of the color in the range [0,255] that are scaled down to a range [0,1]. The image is now a Torch Tensor (array object)
-### Normalize the tensor: transforms.Normalize() normalizes the tensor with mean (0.5) and stdev (0.5)
-#+ You can change the mean and stdev values
 print("\n------------------ANN modeling---------------------------")
-transforms = transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.5,),(0.5,)),])
 # PyTorch tensors are like NumPy arrays that can run on GPU
 # e.g., x = torch.randn(64,100).type(dtype) # need to cast tensor to a CUDA datatype (dtype)
 
@@ -170,33 +266,21 @@ x = Variable
 # PyTorch library provides a clean data set. The following command will download training data in directory './data'
 
 ############################# MODIFIED ################################
-# load dataset
-data = pd.read_csv('emails.csv')
-
-# extract features (text) and labels (spam)
-texts = data['text']
-labels = data['spam']
-
-# convert text to TF-IDF features
-vectorizer = TfidfVectorizer(max_features=5000)
-features = vectorizer.fit_transform(texts).toarray()
-
-# encode labels (optional is already 0/1)
-label_encoder = LabelEncoder()
-encoded_labels = label_encoder.fit_transform(labels)
-
-# split training and testing data
-X_train, X_test, y_train, y_test = train_test_split(features, encoded_labels, test_size=0.2, random_state=0)
-
-# convert to PyTorch tensors
-X_train_tensor = torch.tensor(X_train, dtype=torch.float32)
-y_train_tensor = torch.tensor(y_train, dtype=torch.long) # CrossEntropyLoss expects LongTensor
-X_test_tensor = torch.tensor(X_test, dtype=torch.float32)
-y_test_tensor = torch.tensor(y_test, dtype=torch.long)
-
-# create TensorDataset
-train_dataset = TensorDataset(X_train_tensor, y_train_tensor)
-test_dataset = TensorDataset(X_test_tensor, y_test_tensor)
+# load the TF-IDF tensors prepared by preprocess_483.py (vectorizing is skipped when tfidf_cache.pt matches
+# the current emails.csv and preprocessing settings, and redone otherwise)
+tfidf_tensors = load_tfidf_tensors('emails.csv')
+
+# rebuild the sparse matrices as torch sparse CSR tensors
+X_train_tensor = torch.sparse_csr_tensor(*tfidf_tensors['X_train'][:3], size=tfidf_tensors['X_train'][3])
+y_train_tensor = tfidf_tensors['y_train']
+X_test_tensor = torch.sparse_csr_tensor(*tfidf_tensors['X_test'][:3], size=tfidf_tensors['X_test'][3])
+y_test_tensor = tfidf_tensors['y_test']
+
+# move the whole dataset to the device once (it fits in GPU memory), so batches are sliced on-device
+X_train_tensor = X_train_tensor.to(device)
+y_train_tensor = y_train_tensor.to(device)
+X_test_tensor = X_test_tensor.to(device)
+y_test_tensor = y_test_tensor.to(device)
 
 # train_dataset=datasets.MNIST(root='./data', train=True, transform=transforms, download=True)
 # test_dataset=datasets.MNIST(root='./data', train=False, transform=transforms, download=False)
@@ -208,17 +292,17 @@ test_dataset = TensorDataset(X_test_tensor, y_test_tensor)
 #from torch.utils.data.dataset import random_split
 #train_data, val_data, test_data = random_split(train_dataset, [60,20,20])
 
-### DataLoader will shuffle the training dataset and load the training and test dataset
+### SparseTfidfBatches will shuffle the training dataset and load it in mini batches
+# (the test dataset is evaluated in a single forward pass, see test_ANN_model)
 mini_batch_size = 64 #+ You can change this mini_batch_size
 # If mini_batch_size==100, # of training batches=6000/100=600 batches, each batch contains 100 samples (images, labels)
-# DataLoader will load the data set, shuffle it, and partition it into a set of samples specified by mini_batch_size.
-train_dataloader = DataLoader(dataset=train_dataset, batch_size=mini_batch_size, shuffle=True)
-test_dataloader = DataLoader(dataset=test_dataset, batch_size=mini_batch_size, shuffle=False)
+# SparseTfidfBatches will shuffle the data set on the device, and partition it into a set of samples specified by mini_batch_size.
+# drop_last=True keeps every training batch at mini_batch_size rows and, for the compiled model, pad_nnz=True keeps
+# the number of entries fixed too, so every training batch has the same shape.
+train_dataloader = SparseTfidfBatches(X_train_tensor, y_train_tensor, batch_size=mini_batch_size, shuffle=True, drop_last=True, pad_nnz=compile_model)
 num_train_batches = len(train_dataloader)
-num_test_batches = len(test_dataloader)
 print("> Mini batch size: ", mini_batch_size)
 print("> Number of batches loaded for training: ", num_train_batches)
-print("> Number of batches loaded for testing: ", num_test_batches)
 
 ### Let's display some images from the first batch to see what actual digit images look like
 iterable_batches = iter(train_dataloader) # making a dataset iterable
@@ -229,7 +313,7 @@ show_digit_image = True
 
 ### Create an object for the ANN model defined in the MLP class
 # Architectural parameters: You can change these parameters except for num_input and num_classes
-num_input = X_train.shape[1]   # 28X28=784 pixels of image
+num_input = X_train_tensor.shape[1]   # 28X28=784 pixels of image
 num_classes = 2    # output layer
 num_neurons_hidden = 64     # number of neurons at the first hidden layer
 # Randomly selected neurons by dropout_pr probability will be dropped (zeroed out) for regularization.
@@ -251,23 +335,23 @@ for param_tensor in MLP_model.state_dict():
 
 #exit()
 
-# To turn on/off CUDA if I don't want to use it.
-CUDA_enabled = True
 if (device.type == 'cuda' and CUDA_enabled):
     print("...Modeling using GPU...")
     MLP_model = MLP_model.to(device=device) # sending to whaever device (for GPU acceleration)
+    # torch.compile fuses the bias-add+ReLU elementwise ops and 'reduce-overhead' captures the step into a CUDA graph
+    if compile_model:
+        MLP_model = torch.compile(MLP_model, mode='reduce-overhead', fullgraph=True)
 else:
     print("...Modeling using CPU...")
 
 ### Define a loss function: You can choose other loss functions
-class_counts = np.bincount(y_train)
-total_samples = len(y_train)
-w0 = total_samples / (2 * class_counts[0])
-w1 = total_samples / (2 * class_counts[1])
-# print(f"w0 = {w0}, w1 = {w1}\n")
-weights = torch.tensor([w0, w1], dtype=torch.float32).to(device)
+# class weights w_c = total_samples / (num_classes * count_c), computed on the device (no host round-trip)
+class_counts = torch.bincount(y_train_tensor, minlength=num_classes).float() # FP32 weights, autocast handles the FP16 logits
+weights = y_train_tensor.numel() / (num_classes * class_counts)
+# print(f"w0 = {weights[0]}, w1 = {weights[1]}\n")
 
-loss_func = nn.CrossEntropyLoss(weight=weights)
+# functional cross entropy with the class weights bound once, instead of an nn.CrossEntropyLoss module
+loss_func = partial(AF.cross_entropy, weight=weights, reduction='mean')
 
 ### Choose a gradient method
 # model hyperparameters and gradient methods
@@ -277,7 +361,13 @@ alpha = 0.008       # learning rate
 gamma = 0.5        # momentum
 # Stochastic Gradient Descent (SGD) is used in this program.
 #+ You can choose other gradient methods (Adagrad, adadelta, Adam, etc.) and parameters
-MLP_optimizer = optim.SGD(MLP_model.parameters(), lr=alpha, momentum=gamma) 
+# The momentum update is done for all parameters at once: a single fused CUDA kernel when this PyTorch version
+# supports fused SGD (torch >= 2.3), otherwise the multi-tensor (foreach) implementation.
+if (device.type == 'cuda' and 'fused' in inspect.signature(optim.SGD).parameters):
+    SGD_impl = {'fused': True} # fused and foreach cannot be both enabled
+else:
+    SGD_impl = {'foreach': True}
+MLP_optimizer = optim.SGD(MLP_model.parameters(), lr=alpha, momentum=gamma, **SGD_impl)
 print("> MLP optimizer's state dictionary")
 for var_name in MLP_optimizer.state_dict():
     print(var_name, MLP_optimizer.state_dict()[var_name])
@@ -289,13 +379,13 @@ print(f"\nTraining Time: {training_time} seconds")
 print("\n............Testing MLP model................")
 print("\n> Input labels:")
 print(labels)
-predicted_labels, true_labels = test_ANN_model(device, CUDA_enabled, MLP_model, test_dataloader)
+# the single test forward pass runs on the uncompiled model: compiling it would cost far more than it saves
+predicted_labels, true_labels = test_ANN_model(device, getattr(MLP_model, '_orig_mod', MLP_model), csr_to_bags(X_test_tensor), y_test_tensor)
 
 print("\n................Performance Results...................")
 print(f"Parameters:")
 print(f"\tMini batch size: {mini_batch_size}")
-print(f"\tNumber of batches loaded for training: {num_train_batches}")
-print(f"\tNumber of batches loaded for testing: {num_test_batches}\n")
+print(f"\tNumber of batches loaded for training: {num_train_batches}\n")
 print(f"\tActivation Function: ReLU")
 print(f"\tLoss Function: Cross Entropy Loss")
 print(f"\tClass Weights: {weights}")
@@ -320,6 +410,23 @@ print(predicted_labels)
 print("> True labels by MLP model")
 print(true_labels)
 
+### Post-training dynamic quantization for CPU inference
+# The weights of the output Linear layer are stored in INT8 and its GEMM runs in INT8 (activations are quantized
+# on the fly); the weights of the hidden1 EmbeddingBag are stored in 8 bits with per-row scales.
+print("\n............Testing INT8 quantized MLP model (CPU)................")
+trained_MLP_model = getattr(MLP_model, '_orig_mod', MLP_model).cpu() # undo torch.compile, quantization works on the nn.Module
+quant_qconfig = {nn.Linear: torch.ao.quantization.default_dynamic_qconfig,
+                 nn.EmbeddingBag: torch.ao.quantization.float_qparams_weight_only_qconfig}
+quant_MLP_model = torch.ao.quantization.quantize_dynamic(trained_MLP_model, quant_qconfig, dtype=torch.qint8)
+start = time.time()
+quant_predicted_labels, quant_true_labels = test_ANN_model(torch.device('cpu'), quant_MLP_model, csr_to_bags(X_test_tensor), y_test_tensor)
+quant_testing_time = time.time() - start
+
+print(f"\nModel size: FP32 = {model_size_in_bytes(trained_MLP_model)} bytes, INT8 = {model_size_in_bytes(quant_MLP_model)} bytes")
+print(f"Testing Time (INT8, CPU): {quant_testing_time} seconds")
+print(f"Accuracy (INT8): {accuracy_score(quant_true_labels, quant_predicted_labels)}")
+print(f"Precision (INT8): {precision_score(quant_true_labels, quant_predicted_labels, zero_division=1)}")
+
 #### To save and load models and model's parameters ####
 # To save and load model parameters
 #print("...Saving and loading model states and model parameters...")
@@ -0,0 +1,89 @@
+import numpy as np
+import os
+
+import torch
+
+########################## Data preparation (TF-IDF) ##########################
+# Vectorizing the emails is the slowest part of a run and does not depend on the model,
+# so it lives here and its output is cached on disk for mlp_483.py:
+#   python preprocess_483.py    -> (re)writes tfidf_cache.pt (mlp_483.py also creates it when it is missing or stale)
+# pandas/scipy/joblib/sklearn are only imported in build_tfidf_tensors(), so loading a valid cache stays cheap.
+
+tfidf_cache = 'tfidf_cache.pt'
+
+# preprocessing settings; bump preprocess_version whenever build_tfidf_tensors() changes so old caches are rebuilt
+preprocess_version = 1
+num_features = 5000
+train_fraction = 0.8
+split_seed = 0
+
+# identifies the data a cache was built from: the preprocessing settings plus the size and mtime of the CSV file
+def tfidf_cache_key(csv_path):
+    csv_stat = os.stat(csv_path)
+    return (preprocess_version, num_features, train_fraction, split_seed, csv_stat.st_size, csv_stat.st_mtime_ns)
+
+# scipy CSR -> (crow_indices, col_indices, values, shape); plain tensors so the cache loads with weights_only=True
+# torch.from_numpy shares the NumPy buffer instead of copying it (astype(copy=False) only copies if the dtype differs)
+def csr_to_tensors(X_csr):
+    return (torch.from_numpy(X_csr.indptr.astype(np.int64, copy=False)), torch.from_numpy(X_csr.indices.astype(np.int64, copy=False)),
+            torch.from_numpy(np.ascontiguousarray(X_csr.data, dtype=np.float32)), tuple(X_csr.shape))
+
+def build_tfidf_tensors(csv_path='emails.csv'):
+    import pandas as pd
+    import scipy.sparse as sp
+    from joblib import Parallel, delayed, cpu_count
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+    from sklearn.preprocessing import LabelEncoder
+
+    # load dataset
+    data = pd.read_csv(csv_path)
+
+    # extract features (text) and labels (spam)
+    texts = data['text']
+    labels = data['spam']
+
+    # convert text to TF-IDF features (kept as a scipy CSR sparse matrix, not densified)
+    # HashingVectorizer is stateless (no vocabulary to build), so the term counts are computed in parallel chunks;
+    # TfidfTransformer then applies the IDF weighting and L2 normalization once on the stacked counts.
+    # The counts are produced directly in FP32 so no FP64 copy of the matrix is ever materialized.
+    vectorizer = HashingVectorizer(n_features=num_features, alternate_sign=False, norm=None, dtype=np.float32)
+    num_chunks = cpu_count()
+    chunk_size = -(-len(texts) // num_chunks) # ceiling division
+    term_counts = sp.vstack(Parallel(n_jobs=-1)(delayed(vectorizer.transform)(texts.iloc[i:i+chunk_size]) for i in range(0, len(texts), chunk_size))).tocsr()
+    features = TfidfTransformer().fit_transform(term_counts).astype(np.float32, copy=False)
+
+    # encode labels (optional is already 0/1)
+    label_encoder = LabelEncoder()
+    encoded_labels = label_encoder.fit_transform(labels)
+
+    # split training and testing data (80/20) with one seeded permutation of the row indices
+    perm = torch.randperm(len(encoded_labels), generator=torch.Generator().manual_seed(split_seed)).numpy()
+    num_train = int(train_fraction * len(encoded_labels))
+    train_idx, test_idx = perm[:num_train], perm[num_train:]
+    X_train, X_test = features[train_idx], features[test_idx]
+    y_train, y_test = encoded_labels[train_idx], encoded_labels[test_idx]
+
+    # convert to PyTorch tensors
+    return {
+        'key': tfidf_cache_key(csv_path),
+        'X_train': csr_to_tensors(X_train),
+        'y_train': torch.from_numpy(y_train.astype(np.int64, copy=False)), # CrossEntropyLoss expects LongTensor
+        'X_test': csr_to_tensors(X_test),
+        'y_test': torch.from_numpy(y_test.astype(np.int64, copy=False)),
+    }
+
+# load the cached TF-IDF tensors, or rebuild (and re-cache) them if the cache is missing or was built
+# from a different CSV file or different preprocessing settings
+def load_tfidf_tensors(csv_path='emails.csv', cache_path=tfidf_cache):
+    if os.path.exists(cache_path):
+        tfidf_tensors = torch.load(cache_path, weights_only=True)
+        if tfidf_tensors.get('key') == tfidf_cache_key(csv_path):
+            return tfidf_tensors
+        print("> TF-IDF cache is out of date, rebuilding", cache_path)
+    tfidf_tensors = build_tfidf_tensors(csv_path)
+    torch.save(tfidf_tensors, cache_path)
+    return tfidf_tensors
+
+if __name__ == '__main__':
+    torch.save(build_tfidf_tensors(), tfidf_cache)
+    print("> TF-IDF tensors saved to", tfidf_cache)